@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import trueskill_api_v3 as api  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(tmp_path, monkeypatch):
+    """Empty ratings, caches and data/cache paths under tmp_path for every test."""
+    monkeypatch.setattr(api, "RATINGS", api.Ratings(api.RATINGS.env))
+    monkeypatch.setattr(api, "APPLIED_MATCH_KEYS", set())
+    monkeypatch.setattr(api, "APPLIED_KEYS_UNKNOWN", False)
+    monkeypatch.setattr(api, "LAST_EVENT_KEY", None)
+    monkeypatch.setattr(api, "LAST_YEAR", None)
+    monkeypatch.setattr(api, "_LEADERBOARD_CACHE", (-1, [], None))
+    monkeypatch.setattr(api, "DATA_PATH", str(tmp_path / "trueskill_data.npz"))
+    monkeypatch.setattr(api, "TBA_CACHE_PATH", str(tmp_path / "tba_cache"))
+    monkeypatch.setattr(api, "_LAST_SAVE_ERROR", None)
+    monkeypatch.setattr(api, "TBA_REQUESTS_PER_SECOND", 1e6)
+    api._WINPROB_CACHE.clear()
+
+
+@pytest.fixture
+def client():
+    return api.app.test_client()
@@ -0,0 +1,510 @@
+import io
+import math
+import os
+import random
+
+import numpy as np
+import orjson
+import pytest
+from requests.structures import CaseInsensitiveDict
+from scipy.special import log_ndtr
+
+import trueskill_api_v3 as api
+
+
+class FakeResponse:
+    """Just enough of requests.Response for _tba_get_json and _parse_match_rows."""
+
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.content = b"" if body is None else orjson.dumps(body)
+        self.raw = io.BytesIO(self.content)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeTBA:
+    """Stands in for _tba_get: serves canned (status, body, headers) per path and records every call."""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+
+    def __call__(self, path, headers=None, stream=False):
+        self.calls.append((path, dict(headers or {})))
+        return FakeResponse(*self.routes[path])
+
+
+def tba_match(key, when, red, blue, red_score, blue_score):
+    return {
+        "key": key, "comp_level": "qm", "set_number": 1, "match_number": int(key.rsplit("qm", 1)[1]),
+        "actual_time": when, "time": when,
+        "alliances": {
+            "red": {"team_keys": red, "score": red_score},
+            "blue": {"team_keys": blue, "score": blue_score},
+        },
+    }
+
+
+def ratings_by_team(ratings):
+    return {k: (ratings.mu[i], ratings.sigma2[i]) for k, i in ratings.team_id.items()}
+
+
+#### Rating kernel ####
+
+def test_rate_matches_agrees_with_trueskill_rate():
+    env = api.RATINGS.env
+    rng = random.Random(7)
+    teams = [f"frc{i}" for i in range(30)]
+    # Distinct starting ratings: trueskill's zero-margin draw is 0/0 when both alliances' mu sums are equal
+    start = [(rng.uniform(15.0, 35.0), rng.uniform(1.0, 8.0)) for _ in teams]
+    expected = {t: env.create_rating(mu, sigma) for t, (mu, sigma) in zip(teams, start)}
+    results = []
+    for _ in range(300):
+        picked = rng.sample(teams, 6)
+        red, blue = picked[:3], picked[3:]
+        score1, score2 = rng.choice([(50, 20), (20, 50), (35, 35)])
+        results.append((red, blue, score1, score2))
+        ranks = [int(score1 < score2), int(score2 < score1)]
+        new_red, new_blue = env.rate([[expected[t] for t in red], [expected[t] for t in blue]], ranks=ranks)
+        expected.update(zip(red, new_red))
+        expected.update(zip(blue, new_blue))
+
+    ratings = api.ratings_from_rows(env, 1, teams, [mu for mu, _ in start], [sigma * sigma for _, sigma in start])
+    assert api._rate_matches(ratings, results) == 300
+    for team, (mu, sigma2) in ratings_by_team(ratings).items():
+        # trueskill's own erf approximation is only good to ~1e-7
+        assert mu == pytest.approx(expected[team].mu, abs=1e-5)
+        assert math.sqrt(sigma2) == pytest.approx(expected[team].sigma, abs=1e-5)
+
+
+@pytest.mark.parametrize("gap", [20.0, 60.0, 100.0, 160.0])
+def test_rate_matches_huge_upsets_stay_accurate(gap):
+    # Red is far stronger but blue wins: t runs from about -5 to past the Mills-ratio cutoff
+    env = api.RATINGS.env
+    keys = ["frc1", "frc2", "frc3", "frc4", "frc5", "frc6"]
+    mu = [gap, gap, gap, 0.0, 0.0, 0.0]
+    sigma2 = [1.0, 2.0, 3.0, 1.5, 2.5, 0.5]
+    ratings = api.ratings_from_rows(env, 1, keys, mu, sigma2)
+    api._rate_matches(ratings, [(keys[:3], keys[3:], 0, 1)])
+
+    # Reference update for a blue win, with v = phi(t)/Phi(t) taken through log_ndtr so it stays exact in the tail
+    tau2 = float(env.tau) ** 2
+    s2 = [s + tau2 for s in sigma2]
+    c2 = 6 * float(env.beta) ** 2 + sum(s2)
+    c = math.sqrt(c2)
+    t = (sum(mu[3:]) - sum(mu[:3])) / c
+    v = math.exp(-0.5 * t * t - 0.5 * math.log(2 * math.pi) - log_ndtr(t))
+    w = v * (v + t)
+    for i in range(6):
+        sign = 1.0 if i >= 3 else -1.0
+        # Past the cutoff the kernel uses the first-order Mills-ratio asymptote, good to a few 1e-6
+        assert ratings.mu[i] == pytest.approx(mu[i] + sign * s2[i] / c * v, rel=1e-5)
+        assert ratings.sigma2[i] == pytest.approx(s2[i] * (1.0 - s2[i] / c2 * w), rel=1e-5)
+        assert 0.0 < ratings.sigma2[i] <= s2[i]
+
+
+#### Saving and loading ####
+
+@pytest.mark.parametrize("filename", ["ratings.npz", "ratings.json"])
+def test_save_load_round_trip(client, tmp_path, filename):
+    body = [
+        {"match_key": f"2025test_qm{i}", "teams1": ["frc1", "frc2", "frc3"], "teams2": ["frc4", "frc5", f"frc{6 + i}"],
+         "score1": 10 + i, "score2": 12}
+        for i in range(5)
+    ]
+    client.post("/push_results", json=body)
+    saved = ratings_by_team(api.RATINGS)
+    path = str(tmp_path / filename)
+    api._write_trueskill_data(path, api._snapshot_trueskill_data(path))
+    assert sorted(os.listdir(tmp_path)) == [filename]  # no sidecar or temp file left behind
+
+    client.post("/push_results", json=[{"teams1": ["frc1"], "teams2": ["frc99"], "score1": 0, "score2": 1}])
+    resp = client.post("/load_data", json={"path": path})
+    assert resp.status_code == 200
+    assert resp.get_json()["teams_indexed"] == len(saved)
+
+    loaded = ratings_by_team(api.RATINGS)
+    assert loaded.keys() == saved.keys()
+    for team, (mu, sigma2) in saved.items():
+        assert loaded[team][0] == pytest.approx(mu, rel=1e-12)
+        assert loaded[team][1] == pytest.approx(sigma2, rel=1e-12)
+    assert api.APPLIED_MATCH_KEYS == {f"2025test_qm{i}" for i in range(5)}
+
+
+def test_load_npz_with_legacy_meta_sidecar(tmp_path):
+    path = tmp_path / "old.npz"
+    np.savez(path, keys=np.array(["frc1", "frc2"]), mu=np.array([30.0, 20.0]), sigma2=np.array([4.0, 9.0]))
+    (tmp_path / "old_meta.json").write_bytes(orjson.dumps({"context": {"year": 2024, "applied_match_keys": ["k"]}}))
+    payload = api._load_trueskill_data(str(path))
+    assert payload["meta"]["context"]["year"] == 2024
+    assert api._apply_data_to_memory(payload) == 2
+    assert api.LAST_YEAR == 2024 and api.APPLIED_MATCH_KEYS == {"k"}
+
+
+def test_replace_atomically_file_modes(tmp_path, monkeypatch):
+    path = str(tmp_path / "ratings.json")
+    monkeypatch.setattr(api, "_UMASK", 0o027)
+    api._replace_atomically(path, lambda f: f.write(b"{}"))
+    assert os.stat(path).st_mode & 0o777 == 0o640  # new file: 0666 less the umask
+    os.chmod(path, 0o604)
+    api._replace_atomically(path, lambda f: f.write(b"[]"))
+    assert os.stat(path).st_mode & 0o777 == 0o604  # existing file keeps its mode
+    assert sorted(os.listdir(tmp_path)) == ["ratings.json"]
+
+
+def test_save_worker_reports_and_clears_last_save_error(client, tmp_path, monkeypatch):
+    client.post("/push_results", json=[push(None)])
+    bad = str(tmp_path / "missing_dir" / "ratings.npz")
+    monkeypatch.setattr(api, "DATA_PATH", bad)
+    assert client.post("/upload_data").status_code == 200  # queued; the write fails later
+    api._SAVE_QUEUE.join()
+    error = client.get("/health").get_json()["last_save_error"]
+    assert error.startswith(bad + ": ")
+
+    good = str(tmp_path / "ratings.npz")
+    monkeypatch.setattr(api, "DATA_PATH", good)
+    assert client.post("/upload_data").status_code == 200
+    api._SAVE_QUEUE.join()
+    assert client.get("/health").get_json()["last_save_error"] is None
+    assert os.path.exists(good)
+
+
+#### Input validation ####
+
+@pytest.mark.parametrize("s, valid", [
+    ("2025", True), ("1992", True), ("202", False), ("20255", False), ("２０２５", False), ("٢٠٢٥", False), ("", False),
+])
+def test_is_year(s, valid):
+    assert api._is_year(s) is valid
+
+
+@pytest.mark.parametrize("s, valid", [
+    ("2025nyny", True), ("2025cmptx", True), ("2025mi2", True), ("2025NYNY", False), ("2025", False),
+    ("2025ny-ny", False), ("2025nyny ", False), ("25nyny", False), ("２０２５nyny", False), ("2025nyñy", False),
+])
+def test_is_event_key(s, valid):
+    assert api._is_event_key(s) is valid
+
+
+@pytest.mark.parametrize("s, valid", [
+    ("frc254", True), ("frc1", True), ("frc", False), ("FRC254", False), ("frc25a", False),
+    ("frc-1", False), ("frc²", False), ("frc٣", False), ("254", False),
+])
+def test_is_team_key(s, valid):
+    assert api._is_team_key(s) is valid
+
+
+@pytest.mark.parametrize("body", [{"event_key": "２０２５nyny"}, {"event_key": "2025ny ny"}, {"year": "٢٠٢٥"}, {"year": 25}])
+def test_update_rejects_malformed_event_keys_and_years(client, body):
+    assert client.post("/update", json=body).status_code == 400
+
+
+#### /update ####
+
+def test_update_applies_each_match_once(client, monkeypatch):
+    red, blue = ["frc1", "frc2", "frc3"], ["frc4", "frc5", "frc6"]
+    matches = [
+        tba_match("2025test_qm1", 1000, red, blue, 30, 10),
+        tba_match("2025test_qm2", 2000, blue, red, 25, 25),
+        tba_match("2025test_qm3", None, red, blue, -1, -1),  # not played yet
+        tba_match("2025test_qm4", 3000, ["frc7", "frc2", "frc3"], blue, 5, 40),
+        tba_match("2025test_qm5", 4000, red, ["frc8", "frc5", "frc6"], 50, 45),
+    ]
+    path = "/event/2025test/matches/simple"
+    tba = FakeTBA({path: (200, matches[:3])})
+    monkeypatch.setattr(api, "_tba_get", tba)
+
+    assert client.post("/update", json={"event_key": "2025test"}).get_json()["matches_applied"] == 2
+    version = api.RATINGS.version
+    assert client.post("/update", json={"event_key": "2025test"}).get_json()["matches_applied"] == 0
+    assert api.RATINGS.version == version  # nothing new, so memoized predictions stay valid
+
+    matches[2] = tba_match("2025test_qm3", 2500, red, blue, 12, 20)
+    tba.routes[path] = (200, matches)
+    assert client.post("/update", json={"event_key": "2025test"}).get_json()["matches_applied"] == 3
+    assert api.APPLIED_MATCH_KEYS == {m["key"] for m in matches}
+
+    # Same ratings as applying every match exactly once, in time order
+    expected = api.Ratings(api.RATINGS.env)
+    played = sorted(matches, key=lambda m: m["actual_time"])
+    api._rate_matches(expected, [
+        (m["alliances"]["red"]["team_keys"], m["alliances"]["blue"]["team_keys"],
+         m["alliances"]["red"]["score"], m["alliances"]["blue"]["score"])
+        for m in played
+    ])
+    incremental = ratings_by_team(api.RATINGS)
+    for team, (mu, sigma2) in ratings_by_team(expected).items():
+        assert incremental[team] == pytest.approx((mu, sigma2))
+
+    assert client.post("/update?force=1", json={"event_key": "2025test"}).get_json()["matches_applied"] == 5
+
+
+def test_update_year_reports_failed_events(client, monkeypatch):
+    monkeypatch.setattr(api, "_tba_get", FakeTBA({
+        "/events/2025/simple": (200, [{"key": "2025good", "end_date": "2025-03-01"}, {"key": "2025bad"}]),
+        "/event/2025good/matches/simple": (200, [tba_match("2025good_qm1", 1000, ["frc1"], ["frc2"], 3, 1)]),
+        "/event/2025bad/matches/simple": (503, None),
+    }))
+    result = client.post("/update", json={"year": 2025}).get_json()
+    assert result["matches_applied"] == 1
+    assert result["events_failed"] == ["2025bad"]
+
+
+def test_update_after_loading_snapshot_without_match_keys_needs_force(client, tmp_path, monkeypatch):
+    red, blue = ["frc1", "frc2", "frc3"], ["frc4", "frc5", "frc6"]
+    matches = [tba_match("2025test_qm1", 1000, red, blue, 30, 10), tba_match("2025test_qm2", 2000, blue, red, 25, 20)]
+    monkeypatch.setattr(api, "_tba_get", FakeTBA({"/event/2025test/matches/simple": (200, matches)}))
+    assert client.post("/update", json={"event_key": "2025test"}).get_json()["matches_applied"] == 2
+    once = ratings_by_team(api.RATINGS)
+
+    # A legacy .json snapshot of those ratings: teams only, no applied_match_keys
+    legacy = tmp_path / "legacy.json"
+    legacy.write_bytes(orjson.dumps({"teams": api._serialize_all_teams(api.RATINGS)}))
+    assert client.post("/load_data", json={"path": str(legacy)}).status_code == 200
+    assert api.APPLIED_KEYS_UNKNOWN and not api.APPLIED_MATCH_KEYS
+    version = api.RATINGS.version
+
+    resp = client.post("/update", json={"event_key": "2025test"})
+    assert resp.status_code == 409
+    assert api.RATINGS.version == version
+    # Re-saving keeps the keys "unknown" rather than writing an empty list
+    assert api._build_export_meta(api.RATINGS)["context"]["applied_match_keys"] is None
+
+    assert client.post("/update", json={"event_key": "2025test", "force": True}).get_json()["matches_applied"] == 2
+    assert not api.APPLIED_KEYS_UNKNOWN
+    rebuilt = ratings_by_team(api.RATINGS)
+    for team, (mu, sigma2) in once.items():
+        assert rebuilt[team] == pytest.approx((mu, sigma2))
+    assert client.post("/update", json={"event_key": "2025test"}).get_json()["matches_applied"] == 0
+
+
+#### /push_results ####
+
+def push(match_key, score1=3, score2=1):
+    return {"match_key": match_key, "teams1": ["frc1", "frc2", "frc3"], "teams2": ["frc4", "frc5", "frc6"],
+            "score1": score1, "score2": score2}
+
+
+def test_push_results_applies_repeated_match_key_once(client):
+    body = [push("2025test_qm1"), push("2025test_qm1"), push(None), push(None)]
+    assert client.post("/push_results", json=body).get_json()["applied"] == 3
+    assert client.post("/push_results", json=[push("2025test_qm1")]).get_json()["applied"] == 0
+    assert api.APPLIED_MATCH_KEYS == {"2025test_qm1"}
+
+
+def test_push_results_skips_non_string_match_keys(client):
+    body = [push(5), push(["2025test_qm1"]), push({"k": 1}), push(""), push(True), push("2025test_qm2")]
+    resp = client.post("/push_results", json=body)
+    assert resp.status_code == 200
+    assert resp.get_json()["applied"] == 1
+    assert api.APPLIED_MATCH_KEYS == {"2025test_qm2"}
+    assert client.post("/upload_data").status_code == 200
+    api._SAVE_QUEUE.join()
+    assert client.get("/health").get_json()["last_save_error"] is None
+
+
+@pytest.mark.parametrize("score, valid", [
+    (0, True), (7, True), (12.5, True), (-1, False), (-0.5, False), (None, False), ("3", False),
+    (True, False), (False, False), (math.nan, False), (math.inf, False),
+])
+def test_is_valid_score(score, valid):
+    assert api._is_valid_score(score) is valid
+
+
+def test_push_results_skips_boolean_scores(client):
+    body = [push(None, True, False), push(None, 1, False), push(None, 3.0, 1)]
+    assert client.post("/push_results", json=body).get_json()["applied"] == 1
+
+
+#### Predictions ####
+
+def test_predictions_accept_non_string_team_entries(client):
+    client.post("/push_results", json=[push(None, 30, 10)])
+    rated = client.post("/predict_match", json={"teams1": ["frc1", "frc2"], "teams2": ["frc4", "frc99"]}).get_json()
+    odd = {"teams1": [" FRC1", "frc2"], "teams2": ["frc4", [1]]}  # [1] is nobody's key: it counts as unrated
+    resp = client.post("/predict_match", json=odd)
+    assert resp.status_code == 200
+    assert resp.get_json()["team1_win_prob"] == pytest.approx(rated["team1_win_prob"])
+    resp = client.post("/predict_batch", json=[odd, {"teams1": [[1]], "teams2": [{"k": 1}]}])
+    assert resp.status_code == 200
+    batch = resp.get_json()
+    assert batch[0]["team1_win_prob"] == pytest.approx(rated["team1_win_prob"])
+    assert batch[1]["team1_win_prob"] == pytest.approx(0.5)
+
+
+def push_random_matches(client, n_teams=12, n_matches=40, seed=3):
+    rng = random.Random(seed)
+    teams = [f"frc{i}" for i in range(1, n_teams + 1)]
+    body = []
+    for _ in range(n_matches):
+        picked = rng.sample(teams, 6)
+        body.append({"teams1": picked[:3], "teams2": picked[3:], "score1": rng.randint(0, 60), "score2": rng.randint(0, 60)})
+    client.post("/push_results", json=body)
+    return teams
+
+
+def test_predict_match_3v3_kernel_agrees_with_generic_path(client, monkeypatch):
+    teams = push_random_matches(client)
+    kernel_calls = []
+    kernel = api._winprob_3v3
+    monkeypatch.setattr(api, "_winprob_3v3", lambda *args: kernel_calls.append(args) or kernel(*args))
+    matchups = [
+        (teams[:3], teams[3:6]),  # all rated: unrolled kernel
+        (teams[6:9], [" FRC10", "frc11", "frc12"]),  # all rated after normalizing: unrolled kernel
+        (teams[:3], ["frc10", "frc11", "frc999"]),  # one unrated team: generic path
+        (teams[:2], teams[3:6]),  # 2v3: generic path
+    ]
+    for teams1, teams2 in matchups:
+        win_prob = client.post("/predict_match", json={"teams1": teams1, "teams2": teams2}).get_json()["team1_win_prob"]
+        assert win_prob == pytest.approx(api.alliance_win_probability(api.RATINGS, teams1, teams2), rel=1e-12)
+    assert len(kernel_calls) == 2
+
+
+def test_predict_batch_mixed_alliance_sizes_and_unrated_teams(client):
+    teams = push_random_matches(client)
+    body = [
+        {"teams1": teams[:3], "teams2": teams[3:6]},
+        {"teams1": [teams[0]], "teams2": teams[1:5]},
+        {"teams1": teams[6:8], "teams2": ["frc500", teams[9]]},  # frc500 has no rating
+        {"teams1": ["frc500", "frc501"], "teams2": ["frc502"]},  # nobody rated
+        {"teams1": [], "teams2": teams[:3]},
+        {"teams1": teams[2:6], "teams2": teams[8:10]},
+    ]
+    results = client.post("/predict_batch", json=body).get_json()
+    assert results[4] == {"error": "teams1/teams2 missing"}
+    for matchup, result in zip(body, results):
+        if matchup["teams1"]:
+            expected = api.alliance_win_probability(api.RATINGS, matchup["teams1"], matchup["teams2"])
+            assert result["team1_win_prob"] == pytest.approx(expected, rel=1e-12)
+            assert result["team2_win_prob"] == pytest.approx(1.0 - expected, rel=1e-12)
+
+
+def test_win_probabilities_memoized_per_ratings_version(client, monkeypatch):
+    teams = push_random_matches(client)
+    a = {"teams1": teams[:3], "teams2": teams[3:6]}
+    b = {"teams1": teams[6:8], "teams2": teams[8:10]}
+    c = {"teams1": teams[1:4], "teams2": teams[9:12]}
+    first = client.post("/predict_batch", json=[a, b]).get_json()
+
+    computed = []  # the matchups that missed the memo
+    batch = api._alliance_win_probabilities
+    monkeypatch.setattr(api, "_alliance_win_probabilities", lambda r, t1, t2: computed.extend(zip(t1, t2)) or batch(r, t1, t2))
+    shuffled = {"teams1": teams[:3][::-1], "teams2": teams[3:6][::-1]}  # same alliances, other order
+    second = client.post("/predict_batch", json=[shuffled, c, b]).get_json()
+    assert computed == [(c["teams1"], c["teams2"])]
+    assert second[0]["team1_win_prob"] == first[0]["team1_win_prob"]
+    assert second[2]["team1_win_prob"] == first[1]["team1_win_prob"]
+    # /predict_match shares the memo
+    monkeypatch.setattr(api, "alliance_win_probability", None)
+    monkeypatch.setattr(api, "_winprob_3v3", None)
+    assert client.post("/predict_match", json=a).get_json()["team1_win_prob"] == first[0]["team1_win_prob"]
+
+    client.post("/push_results", json=[{**a, "score1": 0, "score2": 90}])
+    computed.clear()
+    third = client.post("/predict_batch", json=[a]).get_json()
+    assert computed == [(a["teams1"], a["teams2"])]  # new ratings version: recomputed
+    assert third[0]["team1_win_prob"] < first[0]["team1_win_prob"]
+
+
+#### /leaderboard ####
+
+def leaderboard_keys(client, query=""):
+    return [t["team_key"] for t in client.get(f"/leaderboard{query}").get_json()["teams"]]
+
+
+def test_leaderboard_served_from_cache_until_ratings_change(client, monkeypatch):
+    push_random_matches(client)
+    builds = []
+    serialize = api._serialize_all_teams
+    monkeypatch.setattr(api, "_serialize_all_teams", lambda *args, **kw: builds.append(kw) or serialize(*args, **kw))
+    body = client.get("/leaderboard").get_data()
+    assert client.get("/leaderboard").get_data() == body
+    assert orjson.loads(client.get("/leaderboard?top=5").get_data())["teams"] == orjson.loads(body)["teams"][:5]
+    assert len(builds) == 1
+
+    client.post("/push_results", json=[{"teams1": ["frc1"], "teams2": ["frc2"], "score1": 0, "score2": 0}])
+    assert client.get("/leaderboard").get_data() != body
+    assert len(builds) == 2
+
+
+def test_leaderboard_top_is_prefix_of_full_board_with_ties(client):
+    # Two identical matches leave frc1-3 / frc7-9 (and frc4-6 / frc10-12) tied
+    client.post("/push_results", json=[
+        {"teams1": ["frc1", "frc2", "frc3"], "teams2": ["frc4", "frc5", "frc6"], "score1": 0, "score2": 10},
+        {"teams1": ["frc7", "frc8", "frc9"], "teams2": ["frc10", "frc11", "frc12"], "score1": 0, "score2": 10},
+    ])
+    full = leaderboard_keys(client)
+    assert full[:6] == ["frc4", "frc5", "frc6", "frc10", "frc11", "frc12"]
+    for k in range(1, len(full)):
+        api._LEADERBOARD_CACHE = (-1, [], None)  # exercise the partial selection, not a cached slice
+        assert leaderboard_keys(client, f"?top={k}") == full[:k]
+
+
+def test_leaderboard_cache_holds_one_board_per_version(client):
+    rng = random.Random(3)
+    teams = [f"frc{i}" for i in range(1, 200)]
+    client.post("/push_results", json=[
+        {"teams1": rng.sample(teams, 3), "teams2": rng.sample(teams, 3), "score1": rng.randint(0, 9), "score2": 5}
+        for _ in range(300)
+    ])
+    n = len(api.RATINGS.keys)
+    full = leaderboard_keys(client)
+    for k in range(1, n):
+        assert leaderboard_keys(client, f"?top={k}") == full[:k]
+    version, entries, full_body = api._LEADERBOARD_CACHE
+    assert version == api.RATINGS.version
+    assert [e["team_key"] for e in entries] == full
+    assert full_body is not None
+
+
+#### TBA response cache ####
+
+def test_tba_get_json_revalidates_with_etag(monkeypatch):
+    tba = FakeTBA({"/status": (200, {"n": 1}, {"ETag": '"v1"'})})
+    monkeypatch.setattr(api, "_tba_get", tba)
+    assert api._tba_get_json("/status") == (200, {"n": 1})
+
+    tba.routes["/status"] = (304, None)
+    assert api._tba_get_json("/status") == (200, {"n": 1})
+    assert tba.calls[1][1]["If-None-Match"] == '"v1"'
+
+    tba.routes["/status"] = (200, {"n": 2}, {"ETag": '"v2"'})
+    assert api._tba_get_json("/status") == (200, {"n": 2})
+    assert len(tba.calls) == 3
+
+
+def test_tba_get_json_reuses_fresh_copy_within_max_age(monkeypatch):
+    tba = FakeTBA({"/status": (200, {"n": 1}, {"Cache-Control": "public, max-age=60"})})
+    monkeypatch.setattr(api, "_tba_get", tba)
+    assert api._tba_get_json("/status") == (200, {"n": 1})
+    assert api._tba_get_json("/status") == (200, {"n": 1})
+    assert len(tba.calls) == 1
+
+    tba.routes["/other"] = (200, {"n": 3}, {"Cache-Control": "max-age=0", "ETag": '"x"'})
+    api._tba_get_json("/other")
+    api._tba_get_json("/other")
+    assert len(tba.calls) == 3  # max-age=0 is stored but always revalidated
+
+
+def test_tba_get_json_error_status(monkeypatch):
+    monkeypatch.setattr(api, "_tba_get", FakeTBA({"/missing": (404, None)}))
+    assert api._tba_get_json("/missing") == (404, None)
+
+
+def test_tba_get_json_settled_uses_copy_fetched_after_settling(monkeypatch):
+    tba = FakeTBA({"/event/2024old/matches/simple": (200, [], {"ETag": '"e"'})})
+    monkeypatch.setattr(api, "_tba_get", tba)
+    path = "/event/2024old/matches/simple"
+    api._tba_get_json(path, settled_at=0.0)
+    api._tba_get_json(path, settled_at=0.0)
+    assert len(tba.calls) == 1
+    # A copy fetched before the event settled is revalidated
+    tba.routes[path] = (304, None)
+    api._tba_get_json(path, settled_at=float("inf"))
+    assert len(tba.calls) == 2
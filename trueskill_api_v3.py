@@ -10,9 +10,13 @@
     ranking updates, match predictions, and leaderboard retrieval.
 
     Please set the TBA API key via the TBA_AUTH_KEY environment variable or hardcode it in the code.
-    Optionally set TRUESKILL_DATA_PATH environment variable to specify the JSON file path for saving/loading data.
+    Optionally set TRUESKILL_DATA_PATH environment variable to specify the file path for saving/loading data
+    (.npz by default, or a .json path for the legacy single-file format).
 
     For better performance in production, consider using a WSGI server like Gunicorn or uWSGI to run this Flask app.
+    Ratings live in process memory, so run a single worker: separate worker processes would each hold and update
+    their own copy. Threads in that worker (e.g. gunicorn -w 1 --threads 8) overlap requests waiting on I/O, but
+    the GIL keeps the Python work on one core, so they are not a way to add CPU.
 
     Additionally, you may want to tweak the TrueSkill hyperparameters (mu, sigma, beta, tau, draw_probability)
 
@@ -24,41 +28,336 @@
     This code is provided as-is without warranty of any kind.
 """
 
-from flask import Flask, request, jsonify, abort # TODO: Add abort in case of critical failures
+from flask import Flask, request, abort # TODO: Add abort in case of critical failures
 from flask_cors import CORS
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import atexit
 import math
+import queue
+import shelve
+import tempfile
+import threading
 import time
-from datetime import datetime, timezone
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from datetime import date, datetime, timedelta, timezone
 from typing import Any, Dict
-import json
+import ijson
+import numpy as np
+import orjson
+from scipy.special import ndtr
 import trueskill
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the kernels below also run as plain Python
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
 app = Flask(__name__)
 # Enable CORS for all routes
 CORS(app)
 
-# Global TrueSkill environment and in-memory ratings
-env = trueskill.TrueSkill(draw_probability=0.0)
-TEAM_RATINGS = {}  # Maps team key (e.g. "frc3173") to trueskill.Rating object
+class Ratings:
+    """
+    One version of the in-memory ratings, stored column-wise: team_id maps a team key
+    (e.g. "frc3173") to its row in mu / sigma2, and keys maps rows back to team keys in the
+    order teams were first seen. Array capacity grows geometrically; only the first
+    len(keys) rows are live. The TrueSkill environment (and the constants cached from it)
+    travels with the ratings computed under it.
+    Once published a Ratings is never modified: writers change a draft() and publish that.
+    """
+    __slots__ = ("version", "env", "beta2", "mu0", "sigma2_0", "team_id", "keys", "mu", "sigma2")
+
+    def __init__(self, env: trueskill.TrueSkill, version: int = 0, team_id=None, keys=None, mu=None, sigma2=None):
+        self.version = version  # part of the key for memoized win probabilities and leaderboards
+        self.env = env
+        self.beta2 = float(env.beta) ** 2
+        self.mu0 = float(env.mu)  # prior rating for unseen teams
+        self.sigma2_0 = float(env.sigma) ** 2
+        self.team_id = {} if team_id is None else team_id
+        self.keys = [] if keys is None else keys
+        self.mu = np.empty(0) if mu is None else mu
+        self.sigma2 = np.empty(0) if sigma2 is None else sigma2
+
+    def draft(self) -> "Ratings":
+        """A private copy to apply changes to; it becomes the next version once published."""
+        return Ratings(
+            self.env, self.version + 1,
+            dict(self.team_id), list(self.keys), self.mu.copy(), self.sigma2.copy(),
+        )
+
+    def intern(self, team_key) -> int:
+        """Get a team's row, appending it at the prior rating if not present (drafts only)."""
+        if type(team_key) is not str:
+            team_key = str(team_key)
+        i = self.team_id.get(team_key)
+        if i is not None:
+            return i
+        k = team_key.strip().lower()
+        i = self.team_id.get(k)
+        if i is not None:
+            return i
+        i = len(self.keys)
+        if i == self.mu.shape[0]:
+            # Double the capacity so appends stay amortized O(1)
+            capacity = max(64, 2 * i)
+            self.mu = np.concatenate((self.mu, np.empty(capacity - i)))
+            self.sigma2 = np.concatenate((self.sigma2, np.empty(capacity - i)))
+        self.mu[i] = self.mu0
+        self.sigma2[i] = self.sigma2_0
+        self.team_id[k] = i
+        self.keys.append(k)
+        return i
+
+    def lookup(self, team_key) -> int:
+        """Get a team's row without adding it; -1 if the team has no rating yet."""
+        if type(team_key) is not str:
+            team_key = str(team_key)  # request JSON can hold anything, e.g. [1], which is not hashable
+        i = self.team_id.get(team_key)
+        if i is None:
+            i = self.team_id.get(team_key.strip().lower(), -1)
+        return i
+
+# The current ratings. Readers take this reference once per request and read only from
+# that snapshot, so an update never shows up half-applied (or cached under the wrong version).
+RATINGS = Ratings(trueskill.TrueSkill(draw_probability=0.0))
+APPLIED_MATCH_KEYS = set()  # TBA match keys (e.g. "2025nyrr_qm12") already folded into the ratings
+# True after loading a snapshot that has ratings but no applied_match_keys (legacy files): which matches
+# those ratings contain is unknown, so /update refuses to go incremental until a force rebuild
+APPLIED_KEYS_UNKNOWN = False
+# Serializes writers (/update, /push_results, loads): each builds a draft, then swaps it in
+# with publish_ratings(). Readers never take it. It also guards APPLIED_MATCH_KEYS.
+_RATINGS_WRITE_LOCK = threading.Lock()
+
+WINPROB_CACHE_SIZE = 4096
+_WINPROB_CACHE = OrderedDict()  # (alliance1, alliance2, ratings version) -> win prob (LRU)
+_WINPROB_LOCK = threading.Lock()
+# (ratings version, best-first prefix of the leaderboard entries, full /leaderboard body or None);
+# a ?top=K board is a prefix of the full one, so one entry list per version serves every K
+_LEADERBOARD_CACHE = (-1, [], None)
 
 # Blue Alliance API key (set via environment variable or hardcoded here)
 TBA_AUTH_KEY = os.environ.get("TBA_AUTH_KEY", "HARD_CODED_API_KEY_IF_DESIRED")
+TBA_BASE_URL = "https://www.thebluealliance.com/api/v3"
+TBA_MAX_WORKERS = int(os.environ.get("TBA_MAX_WORKERS", "16"))  # parallel event fetches for year-mode /update
+TBA_REQUESTS_PER_SECOND = float(os.environ.get("TBA_REQUESTS_PER_SECOND", "20"))
+TBA_SESSION = requests.Session()  # shared so keep-alive/TLS connections are reused
+TBA_SESSION.headers.update({"X-TBA-Auth-Key": TBA_AUTH_KEY, "Accept-Encoding": "gzip"})
+# One pooled connection per worker, so parallel fetches never open throwaway connections;
+# dropped connections, rate limiting (429) and transient 5xx are retried with backoff
+# (honoring Retry-After) instead of failing the whole /update
+TBA_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1, pool_maxsize=TBA_MAX_WORKERS, pool_block=True,
+    max_retries=Retry(
+        total=3, backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False,
+    ),
+))
+_TBA_RATE_LOCK = threading.Lock()
+_TBA_NEXT_SLOT = 0.0  # monotonic time the next TBA request may start
+# On-disk cache of TBA responses: path -> (etag, last_modified, body, fresh_until, fetched_at)
+TBA_CACHE_PATH = os.environ.get("TBA_CACHE_PATH", "tba_cache")
+TBA_SETTLED_AFTER_DAYS = 7  # events that ended this long ago are served from cache (if fetched since) without revalidating
+_TBA_CACHE_LOCK = threading.Lock()
+# Playoff rounds sort after quals when matches share a timestamp
+_COMP_ORDER = {"pr": 0, "qm": 1, "ef": 2, "qf": 3, "sf": 4, "f": 5}
+_EMPTY = {}  # shared read-only fallback for missing nested objects in TBA payloads
 
 ##### JSON Saving Configuration #####
-DATA_PATH = os.environ.get("TRUESKILL_DATA_PATH", "trueskill_data.json")
+DATA_PATH = os.environ.get("TRUESKILL_DATA_PATH", "trueskill_data.npz")
 LAST_EVENT_KEY = None
 LAST_YEAR = None
+_SAVE_QUEUE = queue.Queue()  # (path, payload) snapshots waiting to be written by the save worker
+_LAST_SAVE_ERROR = None  # "path: error" from the most recent failed write; cleared by the next good one
+# os.umask can only be read by setting it, so read it once here, before the save worker thread starts
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
 
 #### Helpers ####
 
-def get_team_rating(team_key):
-    """Get the TrueSkill Rating for a team, initializing to default if not present."""
-    k = str(team_key).strip().lower()
-    if k not in TEAM_RATINGS:
-        TEAM_RATINGS[k] = env.create_rating(mu=25, sigma=(25/3))
-    return TEAM_RATINGS[k]
+def ojsonify(obj):
+    """jsonify() replacement that serializes with orjson (NumPy arrays and scalars included)."""
+    return app.response_class(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY), mimetype="application/json")
+
+def _request_json():
+    """Parse the request body with orjson; None if it is empty or not valid JSON."""
+    try:
+        return orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        return None
+
+def publish_ratings(ratings: Ratings):
+    """Make a draft the current ratings in one reference swap (caller holds _RATINGS_WRITE_LOCK)."""
+    global RATINGS
+    RATINGS = ratings
+
+def _winprob_key(ratings: Ratings, teams1, teams2) -> tuple:
+    return (tuple(sorted(map(str, teams1))), tuple(sorted(map(str, teams2))), ratings.version)
+
+def _cached_winprob(key):
+    """Memoized win probability for a _winprob_key, or None if not cached."""
+    with _WINPROB_LOCK:
+        win_prob = _WINPROB_CACHE.get(key)
+        if win_prob is not None:
+            _WINPROB_CACHE.move_to_end(key)
+        return win_prob
+
+def _remember_winprob(key, win_prob: float):
+    with _WINPROB_LOCK:
+        _WINPROB_CACHE[key] = win_prob
+        if len(_WINPROB_CACHE) > WINPROB_CACHE_SIZE:
+            _WINPROB_CACHE.popitem(last=False)
+
+def _tba_get(path: str, headers: dict = None, stream: bool = False) -> requests.Response:
+    """GET a TBA API path, spacing request starts out across all threads to respect rate limits."""
+    global _TBA_NEXT_SLOT
+    with _TBA_RATE_LOCK:
+        now = time.monotonic()
+        wait = _TBA_NEXT_SLOT - now
+        _TBA_NEXT_SLOT = max(now, _TBA_NEXT_SLOT) + 1.0 / TBA_REQUESTS_PER_SECOND
+    if wait > 0:
+        time.sleep(wait)
+    return TBA_SESSION.get(f"{TBA_BASE_URL}{path}", headers=headers, timeout=30, stream=stream)
+
+def _max_age(headers) -> float:
+    """Seconds a response may be reused without revalidation, from its Cache-Control header."""
+    for directive in headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name.lower() == "max-age":
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return 0.0
+    return 0.0
+
+def _tba_get_json(path: str, settled_at: float = None, parse=None):
+    """
+    GET a TBA API path as JSON. A cached copy still within its Cache-Control max-age is
+    returned as-is; an older one is revalidated with If-None-Match / If-Modified-Since so
+    unchanged payloads come back as a bodyless 304.
+    settled_at (epoch seconds, see _event_settled_at) marks when the data stopped changing:
+    a cached copy fetched or revalidated after it is returned without contacting TBA at all.
+    parse, if given, consumes the streamed response instead of orjson-parsing the body; its
+    result is what gets cached.
+    Returns (status_code, data); data is None unless the status is 200.
+    """
+    cache_key = path if parse is None else f"{path}#{parse.__name__}"
+    with _TBA_CACHE_LOCK, shelve.open(TBA_CACHE_PATH) as cache:
+        cached = cache.get(cache_key)
+    headers = {}
+    if cached is not None:
+        etag, last_modified, body = cached[:3]
+        fresh_until = cached[3] if len(cached) > 3 else 0.0
+        fetched_at = cached[4] if len(cached) > 4 else 0.0
+        if time.time() < fresh_until or (settled_at is not None and fetched_at >= settled_at):
+            return 200, body
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    with _tba_get(path, headers, stream=parse is not None) as resp:
+        if resp.status_code == 304 and cached is not None:
+            data = body
+        elif resp.status_code != 200:
+            return resp.status_code, None
+        else:
+            data = orjson.loads(resp.content) if parse is None else parse(resp)
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+    now = time.time()
+    max_age = _max_age(resp.headers)
+    if etag or last_modified or max_age:
+        with _TBA_CACHE_LOCK, shelve.open(TBA_CACHE_PATH) as cache:
+            cache[cache_key] = (etag, last_modified, data, now + max_age, now)
+    return 200, data
+
+def _parse_match_rows(resp: requests.Response) -> list:
+    """
+    Stream-parse a matches/simple response with ijson, keeping only what rating updates need:
+    (match_key, sort_key, red_team_keys, red_score, blue_team_keys, blue_score) per match,
+    where sort_key = (time, comp level order, set number, match number) is built once here.
+    """
+    resp.raw.decode_content = True
+    matches = []
+    for m in ijson.items(resp.raw, "item", use_float=True):
+        alliances = m.get("alliances") or _EMPTY
+        red = alliances.get("red") or _EMPTY
+        blue = alliances.get("blue") or _EMPTY
+        matches.append((
+            m.get("key"),
+            (
+                m.get("actual_time") or m.get("time") or 0,
+                _COMP_ORDER.get(m.get("comp_level"), len(_COMP_ORDER)),
+                m.get("set_number") or 0,
+                m.get("match_number") or 0,
+            ),
+            red.get("team_keys") or (),
+            red.get("score"),
+            blue.get("team_keys") or (),
+            blue.get("score"),
+        ))
+    return matches
+
+def _is_year(s: str) -> bool:
+    """Four ASCII digits, e.g. 2025."""
+    return len(s) == 4 and s.isascii() and s.isdigit()
+
+def _is_event_key(s: str) -> bool:
+    """A year followed by lowercase ASCII letters/digits, e.g. 2025nyny."""
+    code = s[4:]
+    return _is_year(s[:4]) and code.isascii() and code.isalnum() and code == code.lower()
+
+def _is_team_key(s: str) -> bool:
+    """frc followed by ASCII digits, e.g. frc254."""
+    number = s[3:]
+    return s.startswith("frc") and number.isascii() and number.isdigit()
+
+def _is_valid_score(score) -> bool:
+    """
+    A played match's score: a finite, non-negative number (TBA reports unplayed matches as null or -1).
+    bool is rejected even though it is an int subclass.
+    """
+    if isinstance(score, float):
+        return math.isfinite(score) and score >= 0
+    return isinstance(score, int) and not isinstance(score, bool) and score >= 0
+
+def _event_settled_at(event: dict):
+    """
+    Epoch seconds from which the event's matches will not change (end_date plus
+    TBA_SETTLED_AFTER_DAYS), or None if that is still in the future or end_date is unknown.
+    """
+    try:
+        end = date.fromisoformat(event.get("end_date") or "")
+    except ValueError:
+        return None
+    settled = datetime.combine(end + timedelta(days=TBA_SETTLED_AFTER_DAYS), datetime.min.time(), timezone.utc)
+    settled_at = settled.timestamp()
+    return settled_at if settled_at < time.time() else None
+
+def _fetch_event_matches(event_key: str, settled_at: float = None) -> list:
+    """
+    All matches for one event (see _parse_match_rows).
+    Raises requests.HTTPError if TBA answers with an error status, so the caller can report the event.
+    """
+    status, ev_matches = _tba_get_json(f"/event/{event_key}/matches/simple", settled_at, _parse_match_rows)
+    if status != 200:
+        raise requests.HTTPError(f"TBA API request failed (status {status}) for event {event_key}")
+    return ev_matches
+
+def ratings_from_rows(env: trueskill.TrueSkill, version: int, keys, mu, sigma2) -> Ratings:
+    """Unpublished ratings holding exactly the given rows (keys must be unique and normalized)."""
+    n = len(keys)
+    ratings = Ratings(env, version, dict(zip(keys, range(n))), list(keys), np.empty(max(64, n)), np.empty(max(64, n)))
+    ratings.mu[:n] = mu
+    ratings.sigma2[:n] = sigma2
+    return ratings
 
 def team_confidence_from_sigma(sigma: float, env: trueskill.TrueSkill) -> float:
     """
@@ -72,51 +371,360 @@ def team_confidence_from_sigma(sigma: float, env: trueskill.TrueSkill) -> float:
     frac = max(0.0, min(1.0, frac))
     return 100.0 * frac
 
-def _serialize_team_entry(team_key: str, rating: trueskill.Rating) -> dict:
-    mu = float(rating.mu)
-    sigma = float(rating.sigma)
+def _serialize_all_teams(ratings: Ratings, by_conservative: bool = False, top: int = 0) -> list:
+    """
+    Serialize every team with the derived fields computed as whole arrays.
+    Teams come out in row order (the order they were first seen), so no sort is needed,
+    or best conservative rating first with by_conservative=True. With top > 0 only the
+    best `top` teams are returned; they are picked with np.partition, so only those get sorted.
+    """
+    n = len(ratings.keys)
+    mu = ratings.mu[:n]
+    sigma = np.sqrt(ratings.sigma2[:n])
+    conservative = mu - 3.0 * sigma
+    sigma0 = float(ratings.env.sigma)
+    if sigma0 > 0:
+        confidence = np.round(100.0 * np.clip(1.0 - (sigma / sigma0) ** 2, 0.0, 1.0), 2)
+    else:
+        confidence = np.zeros(n)
+    keys = ratings.keys
+    if by_conservative:
+        if 0 < top < n:
+            # Everything above the top-th value, then ties at it in row order, so the result is
+            # exactly a prefix of the full stable sort
+            kth = -np.partition(-conservative, top - 1)[top - 1]
+            above = np.flatnonzero(conservative > kth)
+            best = np.concatenate((above, np.flatnonzero(conservative == kth)[:top - above.size]))
+            best.sort()
+            order = best[np.argsort(-conservative[best], kind="stable")]
+        else:
+            order = np.argsort(-conservative, kind="stable")
+        keys = [ratings.keys[i] for i in order.tolist()]
+        mu, sigma, conservative, confidence = mu[order], sigma[order], conservative[order], confidence[order]
+    return [
+        {
+            "team_key": k,
+            "mu": m,
+            "sigma": sd,
+            "conservative_mu_3sigma": cons,
+            "confidence_percent": conf,
+        }
+        for k, m, sd, cons, conf in zip(
+            keys, mu.tolist(), sigma.tolist(), conservative.tolist(), confidence.tolist()
+        )
+    ]
+
+_SQRT1_2 = 0.7071067811865476  # 1/sqrt(2)
+_INV_SQRT_2PI = 0.3989422804014327  # 1/sqrt(2*pi)
+_TAIL_CDF = 2.222e-162  # below this Phi(t), v and w come from the Mills-ratio asymptote
+
+@njit(cache=True)
+def _phi(x):
+    """Standard normal pdf."""
+    return _INV_SQRT_2PI * math.exp(-0.5 * x * x)
+
+@njit(cache=True)
+def _Phi(x):
+    """Standard normal cdf; erfc keeps full relative precision far into the lower tail."""
+    return 0.5 * math.erfc(-x * _SQRT1_2)
+
+@njit(cache=True)
+def _ts_update_2team(mu, sigma2, red, blu, outcome, beta2, tau2):
+    """
+    Closed-form two-team TrueSkill update, in place on rows red and blu of mu/sigma2.
+    outcome is +1 if red won, -1 if blue won and 0 for a tie.
+    """
+    # sign=+1 when red won (or tied), -1 when blue won
+    sign = -1.0 if outcome < 0 else 1.0
+    ssum = 0.0
+    dmu = 0.0
+    for i in red:
+        sigma2[i] += tau2
+        ssum += sigma2[i]
+        dmu += mu[i]
+    for i in blu:
+        sigma2[i] += tau2
+        ssum += sigma2[i]
+        dmu -= mu[i]
+    c2 = (red.shape[0] + blu.shape[0]) * beta2 + ssum
+    c = math.sqrt(c2)
+    t = sign * dmu / c
+    if outcome == 0:
+        # draw_probability=0: the tie pins the performance difference to zero
+        v = -t
+        w = 1.0
+    else:
+        cdf = _Phi(t)
+        if cdf > _TAIL_CDF:
+            v = _phi(t) / cdf
+            w = v * (v + t)
+        else:
+            # Huge upset (t < about -27): phi/Phi ~ -t - 1/t, and w ~ 1 - 1/t^2
+            v = -t - 1.0 / t
+            w = 1.0 - 1.0 / (t * t)
+    for i in red:
+        mu[i] += sign * sigma2[i] / c * v
+        sigma2[i] *= 1.0 - sigma2[i] / c2 * w
+    for i in blu:
+        mu[i] -= sign * sigma2[i] / c * v
+        sigma2[i] *= 1.0 - sigma2[i] / c2 * w
+
+@njit(cache=True)
+def _apply_matches_nb(red_idx, red_off, blu_idx, blu_off, outcome, mu, sigma2, beta, tau):
+    """
+    Sequential two-team TrueSkill update over a whole list of matches.
+    Alliances are CSR-style: match m's red teams are red_idx[red_off[m]:red_off[m + 1]],
+    and outcome[m] is +1/-1/0 for a red win/blue win/tie.
+    Updates mu and sigma2 in place.
+    Matches must be applied in order, on one thread, because each update depends on the ratings
+    left by the matches before it.
+    """
+    beta2 = beta * beta
+    tau2 = tau * tau
+    for m in range(outcome.shape[0]):
+        _ts_update_2team(
+            mu, sigma2,
+            red_idx[red_off[m]:red_off[m + 1]], blu_idx[blu_off[m]:blu_off[m + 1]],
+            outcome[m], beta2, tau2,
+        )
+
+def _rate_matches(ratings: Ratings, results) -> int:
+    """
+    Apply (teams1, teams2, score1, score2) results, in order, to a draft's mu/sigma2.
+    One pass turns team keys into row ids (interning new teams) and scores into
+    +1/-1/0 outcomes; the arrays are then handed to _apply_matches_nb in one call,
+    which updates mu/sigma2 in place.
+    Returns the number of results applied.
+    """
+    team_id = ratings.team_id.get
+    intern = ratings.intern
+    red_idx, red_off = [], [0]
+    blu_idx, blu_off = [], [0]
+    outcome = []
+    for teams1, teams2, score1, score2 in results:
+        for t in teams1:
+            i = team_id(t)
+            red_idx.append(intern(t) if i is None else i)
+        for t in teams2:
+            i = team_id(t)
+            blu_idx.append(intern(t) if i is None else i)
+        red_off.append(len(red_idx))
+        blu_off.append(len(blu_idx))
+        outcome.append((score1 > score2) - (score1 < score2))
+    # Read the arrays only now: interning may have grown (reallocated) them
+    _apply_matches_nb(
+        np.array(red_idx, dtype=np.int32), np.array(red_off, dtype=np.int32),
+        np.array(blu_idx, dtype=np.int32), np.array(blu_off, dtype=np.int32),
+        np.array(outcome, dtype=np.int8),
+        ratings.mu, ratings.sigma2, float(ratings.env.beta), float(ratings.env.tau),
+    )
+    return len(results)
+
+@njit(cache=True)
+def _winprob_3v3(mu, sigma2, a, b, c, d, e, f, beta2):
+    """
+    alliance_win_probability unrolled for the usual 3v3 FRC match: rows (a, b, c) over (d, e, f).
+    Every row id must be a rated team.
+    """
+    dmu = mu[a] + mu[b] + mu[c] - mu[d] - mu[e] - mu[f]
+    s2 = 6.0 * beta2 + sigma2[a] + sigma2[b] + sigma2[c] + sigma2[d] + sigma2[e] + sigma2[f]
+    if s2 <= 0.0:
+        return 0.5
+    return 0.5 * math.erfc(-dmu / math.sqrt(2.0 * s2))
+
+def _alliance_moments(ratings: Ratings, teams) -> tuple:
+    """Sums of mu and sigma^2 over an alliance; teams with no rating count at the prior."""
+    mu_sum = 0.0
+    sigma_sq_sum = 0.0
+    unrated = 0
+    for t in teams:
+        i = ratings.lookup(t)
+        if i < 0:
+            unrated += 1
+            continue
+        mu_sum += ratings.mu[i]
+        sigma_sq_sum += ratings.sigma2[i]
+    if unrated:
+        # The prior is only looked up when an alliance actually has unrated teams
+        mu_sum += unrated * ratings.mu0
+        sigma_sq_sum += unrated * ratings.sigma2_0
+    return mu_sum, sigma_sq_sum
+
+def alliance_win_probability(ratings: Ratings, teams1, teams2) -> float:
+    """TrueSkill win probability of alliance teams1 over alliance teams2."""
+    mu1, sigma_sq1 = _alliance_moments(ratings, teams1)
+    mu2, sigma_sq2 = _alliance_moments(ratings, teams2)
+    denom = math.sqrt((len(teams1) + len(teams2)) * ratings.beta2 + sigma_sq1 + sigma_sq2)
+    return 0.5 * math.erfc((mu2 - mu1) / denom * _SQRT1_2) if denom != 0 else 0.5
+
+def _alliance_win_probabilities(ratings: Ratings, teams1_list, teams2_list) -> list:
+    """
+    Win probability of teams1_list[i] over teams2_list[i] for every matchup at once.
+    Every alliance's row ids are flattened into one array (teams1 alliances first, then
+    teams2) and summed per alliance with np.add.reduceat, so the gathers, sums, sqrt and
+    normal CDF each run as a single NumPy operation over the whole batch.
+    Teams with no rating (id -1) count at the prior.
+    """
+    alliances = [*teams1_list, *teams2_list]
+    sizes = np.fromiter((len(a) for a in alliances), dtype=np.intp, count=len(alliances))
+    offsets = np.zeros(len(alliances), dtype=np.intp)
+    np.cumsum(sizes[:-1], out=offsets[1:])
+    ids = np.fromiter((ratings.lookup(t) for a in alliances for t in a), dtype=np.intp, count=int(sizes.sum()))
+    known = ids >= 0
+    safe_ids = np.where(known, ids, 0)
+    if ratings.keys:
+        mu = np.where(known, ratings.mu[safe_ids], ratings.mu0)
+        sigma2 = np.where(known, ratings.sigma2[safe_ids], ratings.sigma2_0)
+    else:
+        mu = np.full(ids.shape, ratings.mu0)
+        sigma2 = np.full(ids.shape, ratings.sigma2_0)
+    mu_sum = np.add.reduceat(mu, offsets)
+    sigma_sq_sum = np.add.reduceat(sigma2, offsets)
+    b = len(teams1_list)
+    delta_mu = mu_sum[:b] - mu_sum[b:]
+    n = sizes[:b] + sizes[b:]
+    denom = np.sqrt(n * ratings.beta2 + sigma_sq_sum[:b] + sigma_sq_sum[b:])
+    safe = denom != 0
+    win_prob = np.where(safe, ndtr(delta_mu / np.where(safe, denom, 1.0)), 0.5)
+    return win_prob.tolist()
+
+def _build_export_meta(ratings: Ratings) -> dict:
+    env = ratings.env
     return {
-        "team_key": team_key,
-        "mu": mu,
-        "sigma": sigma,
-        "conservative_mu_3sigma": mu - 3.0 * sigma,
-        "confidence_percent": round(team_confidence_from_sigma(sigma, env), 2),
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "source": "The Blue Alliance (processed locally)",
+        "env": {
+            "mu": float(env.mu),
+            "sigma": float(env.sigma),
+            "beta": float(env.beta),
+            "tau": float(env.tau),
+            "draw_probability": float(env.draw_probability),
+        },
+        "context": {
+            "event_key": LAST_EVENT_KEY,
+            "year": LAST_YEAR,
+            "teams_indexed": len(ratings.keys),
+            # null keeps "unknown" through a re-save, so reloading this file still needs a force rebuild
+            "applied_match_keys": None if APPLIED_KEYS_UNKNOWN else sorted(APPLIED_MATCH_KEYS),
+        },
     }
 
-def _build_export_payload() -> dict:
-    teams = [_serialize_team_entry(k, v) for k, v in sorted(TEAM_RATINGS.items(), key=lambda kv: kv[0])]
+def _build_export_payload(ratings: Ratings) -> dict:
+    return {"meta": _build_export_meta(ratings), "teams": _serialize_all_teams(ratings)}
+
+def _meta_path(path: str) -> str:
+    """JSON sidecar that held env/context for .npz ratings files written before meta moved into the .npz."""
+    return os.path.splitext(path)[0] + "_meta.json"
+
+def _replace_atomically(path: str, write):
+    """Run write(f) on a fresh temp file next to path, then swap it in so readers never see a partial file."""
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False
+    ) as f:
+        try:
+            write(f)
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    # Temp files are created 0600: keep an existing file's mode, and give a new one what open() would (0666 less the umask)
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    os.chmod(f.name, mode)
+    os.replace(f.name, path)
+
+def _write_trueskill_json(path: str, payload: dict):
+    data = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    _replace_atomically(path, lambda f: f.write(data))
+
+def _load_trueskill_json(path: str = DATA_PATH) -> dict:
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+def _build_npz_payload(ratings: Ratings) -> dict:
+    n = len(ratings.keys)
     return {
-        "meta": {
-            "generated_at": datetime.now(timezone.utc).isoformat(),
-            "source": "The Blue Alliance (processed locally)",
-            "env": {
-                "mu": float(env.mu),
-                "sigma": float(env.sigma),
-                "beta": float(env.beta),
-                "tau": float(env.tau),
-                "draw_probability": float(env.draw_probability),
-            },
-            "context": {
-                "event_key": LAST_EVENT_KEY,
-                "year": LAST_YEAR,
-                "teams_indexed": len(TEAM_RATINGS),
-            },
-        },
-        "teams": teams,
+        "meta": _build_export_meta(ratings),
+        "keys": np.array(ratings.keys, dtype=str),
+        # Published arrays are never written again, so views are safe to hand to the save worker
+        "mu": ratings.mu[:n],
+        "sigma2": ratings.sigma2[:n],
     }
 
-def _save_trueskill_json(path: str = DATA_PATH) -> dict:
-    payload = _build_export_payload()
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, indent=2)
+def _write_trueskill_npz(path: str, payload: dict):
+    # meta rides along as a JSON byte array, so one replace commits ratings and metadata together
+    meta = np.frombuffer(orjson.dumps(payload["meta"]), dtype=np.uint8)
+    _replace_atomically(
+        path, lambda f: np.savez(f, keys=payload["keys"], mu=payload["mu"], sigma2=payload["sigma2"], meta=meta)
+    )
+
+def _load_trueskill_npz(path: str = DATA_PATH) -> dict:
+    with np.load(path) as data:
+        payload = {"keys": data["keys"], "mu": data["mu"], "sigma2": data["sigma2"]}
+        if "meta" in data.files:
+            payload["meta"] = orjson.loads(data["meta"].tobytes())
+            return payload
+    try:
+        with open(_meta_path(path), "rb") as f:
+            payload["meta"] = orjson.loads(f.read())
+    except FileNotFoundError:
+        payload["meta"] = {}
     return payload
 
-def _load_trueskill_json(path: str = DATA_PATH) -> dict:
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+def _is_json_path(path: str) -> bool:
+    return path.lower().endswith(".json")
 
-def _apply_json_to_memory(payload: dict, use_env_from_json: bool = False) -> int:
-    global env, LAST_EVENT_KEY, LAST_YEAR
+def _snapshot_trueskill_data(path: str = DATA_PATH) -> dict:
+    """
+    Copy the current ratings into a payload for path's format (see _write_trueskill_data).
+    Taken under the writer lock so the ratings, applied match keys and context all come from one state.
+    """
+    with _RATINGS_WRITE_LOCK:
+        ratings = RATINGS
+        return _build_export_payload(ratings) if _is_json_path(path) else _build_npz_payload(ratings)
+
+def _write_trueskill_data(path: str, payload: dict):
+    """Write a snapshot to disk: a .json path keeps the legacy single-file format, anything else is .npz."""
+    if _is_json_path(path):
+        _write_trueskill_json(path, payload)
+    else:
+        _write_trueskill_npz(path, payload)
+
+def _queue_save(path: str = DATA_PATH) -> dict:
+    """Snapshot the ratings now and leave the disk write to the save worker; returns the snapshot."""
+    payload = _snapshot_trueskill_data(path)
+    _SAVE_QUEUE.put((path, payload))
+    return payload
+
+def _save_worker():
+    """Single consumer for _SAVE_QUEUE, so saves are written one at a time and in order."""
+    global _LAST_SAVE_ERROR
+    while True:
+        path, payload = _SAVE_QUEUE.get()
+        try:
+            _write_trueskill_data(path, payload)
+            _LAST_SAVE_ERROR = None
+        except Exception as e:
+            app.logger.exception("Failed to write %s", path)
+            _LAST_SAVE_ERROR = f"{path}: {e}"
+        finally:
+            _SAVE_QUEUE.task_done()
+
+threading.Thread(target=_save_worker, name="trueskill-save", daemon=True).start()
+atexit.register(_SAVE_QUEUE.join)  # the worker is a daemon thread, so finish queued saves before exiting
+
+def _load_trueskill_data(path: str = DATA_PATH) -> dict:
+    """Read a ratings file written by _write_trueskill_data (format chosen by extension)."""
+    _SAVE_QUEUE.join()  # let queued saves land first so the file reflects them
+    if _is_json_path(path):
+        return _load_trueskill_json(path)
+    return _load_trueskill_npz(path)
+
+def _apply_data_to_memory(payload: dict, use_env_from_json: bool = False) -> int:
+    global LAST_EVENT_KEY, LAST_YEAR, APPLIED_KEYS_UNKNOWN
+    env = RATINGS.env
     if use_env_from_json:
         try:
             meta_env = (payload.get("meta") or {}).get("env") or {}
@@ -128,28 +736,40 @@ def _apply_json_to_memory(payload: dict, use_env_from_json: bool = False) -> int
             env = trueskill.TrueSkill(mu=mu, sigma=sigma, beta=beta, tau=tau, draw_probability=draw_probability)
         except Exception:
             pass
-    TEAM_RATINGS.clear()
-    teams = payload.get("teams", []) or []
-    for entry in teams:
-        key_raw = entry.get("team_key", "")
-        if key_raw is None:
-            continue
-        key = str(key_raw).strip().lower()
-        mu = entry.get("mu")
-        sigma = entry.get("sigma")
-        if not key or mu is None or sigma is None:
-            continue
-        TEAM_RATINGS[key] = env.create_rating(mu=float(mu), sigma=float(sigma))
+    version = RATINGS.version + 1
+    if "keys" in payload:
+        ratings = ratings_from_rows(env, version, payload["keys"].tolist(), payload["mu"], payload["sigma2"])
+    else:
+        # Legacy JSON: one dict per team; later duplicates win
+        rows = {}
+        for entry in payload.get("teams", []) or []:
+            key_raw = entry.get("team_key", "")
+            if key_raw is None:
+                continue
+            key = str(key_raw).strip().lower()
+            mu = entry.get("mu")
+            sigma = entry.get("sigma")
+            if not key or mu is None or sigma is None:
+                continue
+            rows[key] = (float(mu), float(sigma) ** 2)
+        ratings = ratings_from_rows(env, version, list(rows), [r[0] for r in rows.values()], [r[1] for r in rows.values()])
+    publish_ratings(ratings)
     meta_ctx = (payload.get("meta") or {}).get("context") or {}
+    applied_keys = meta_ctx.get("applied_match_keys")
+    APPLIED_MATCH_KEYS.clear()
+    APPLIED_MATCH_KEYS.update(k for k in applied_keys or [] if isinstance(k, str) and k)
+    APPLIED_KEYS_UNKNOWN = applied_keys is None and len(ratings.keys) > 0
     LAST_EVENT_KEY = meta_ctx.get("event_key")
     y = meta_ctx.get("year")
     try:
         LAST_YEAR = int(y) if y is not None and str(y).isdigit() else y
     except Exception:
         LAST_YEAR = y
-    return len(TEAM_RATINGS)
+    return len(ratings.keys)
 
 def _count_teams_in_payload(payload: dict) -> int:
+    if "keys" in payload:
+        return len(payload["keys"])
     teams = payload.get("teams", [])
     return len(teams) if isinstance(teams, list) else 0
 
@@ -157,122 +777,154 @@ def _count_teams_in_payload(payload: dict) -> int:
 
 @app.get("/health")
 def health():
-    return jsonify({"ok": True, "teams_indexed": len(TEAM_RATINGS)})
+    return ojsonify({"ok": True, "teams_indexed": len(RATINGS.keys), "last_save_error": _LAST_SAVE_ERROR})
+
+def _applied_keys_unknown_response():
+    return ojsonify({
+        "error": "The loaded ratings do not record which matches they already include, so an incremental "
+                 "update could apply them twice; pass \"force\": true to rebuild from scratch"
+    }), 409
 
 @app.route('/update', methods=['POST'])
 def update_ratings():
-    """Rebuild ratings from TBA match data for an event or an entire year."""
-    data = request.get_json(force=True)
+    """
+    Update ratings from TBA match data for an event or an entire year.
+    Only matches not already applied are processed; pass "force": true (or ?force=1)
+    to reset and rebuild from scratch. After loading a snapshot that does not record its
+    applied match keys, only a force rebuild is accepted (409 otherwise).
+    """
+    global LAST_EVENT_KEY, LAST_YEAR, APPLIED_KEYS_UNKNOWN
+    data = _request_json()
     if data is None:
-        return jsonify({"error": "No JSON body provided"}), 400
+        return ojsonify({"error": "No JSON body provided"}), 400
     event_key = data.get('event_key')
     year = data.get('year')
+    force = bool(data.get('force')) or request.args.get('force') == '1'
     if (event_key and year) or (not event_key and not year):
-        return jsonify({"error": "Provide either 'event_key' or 'year'"}), 400
+        return ojsonify({"error": "Provide either 'event_key' or 'year'"}), 400
+    if event_key:
+        event_key = str(event_key).strip().lower()
+        if not _is_event_key(event_key):
+            return ojsonify({"error": f"Invalid event_key: {event_key}"}), 400
+    elif not _is_year(str(year).strip()):
+        return ojsonify({"error": f"Invalid year: {year}"}), 400
     if not TBA_AUTH_KEY:
-        return jsonify({"error": "TBA API key not configured"}), 500
+        return ojsonify({"error": "TBA API key not configured"}), 500
+    if APPLIED_KEYS_UNKNOWN and not force:  # checked again under the lock; this just skips a pointless fetch
+        return _applied_keys_unknown_response()
     matches = []
+    failed_events = []
     try:
         if event_key:
-            url = f"https://www.thebluealliance.com/api/v3/event/{event_key}/matches/simple"
-            resp = requests.get(url, headers={"X-TBA-Auth-Key": TBA_AUTH_KEY})
-            if resp.status_code != 200:
-                return jsonify({"error": f"TBA API request failed (status {resp.status_code}) for event {event_key}"}), 500
-            matches = resp.json()
+            status, matches = _tba_get_json(f"/event/{event_key}/matches/simple", parse=_parse_match_rows)
+            if status != 200:
+                return ojsonify({"error": f"TBA API request failed (status {status}) for event {event_key}"}), 500
         else:
             year_int = int(year)
-            url = f"https://www.thebluealliance.com/api/v3/events/{year_int}/simple"
-            resp = requests.get(url, headers={"X-TBA-Auth-Key": TBA_AUTH_KEY})
-            if resp.status_code != 200:
-                return jsonify({"error": f"TBA API request failed (status {resp.status_code}) for year {year_int}"}), 500
-            events_list = resp.json()
+            status, events_list = _tba_get_json(f"/events/{year_int}/simple")
+            if status != 200:
+                return ojsonify({"error": f"TBA API request failed (status {status}) for year {year_int}"}), 500
             if not isinstance(events_list, list):
-                return jsonify({"error": f"Unexpected response for events {year_int}"}), 500
-            for ev in events_list:
-                ev_key = ev.get('key')
-                if not ev_key:
-                    continue
-                url_matches = f"https://www.thebluealliance.com/api/v3/event/{ev_key}/matches/simple"
-                resp2 = requests.get(url_matches, headers={"X-TBA-Auth-Key": TBA_AUTH_KEY})
-                if resp2.status_code == 200:
-                    ev_matches = resp2.json()
-                    if isinstance(ev_matches, list):
-                        matches.extend(ev_matches)
-                time.sleep(0.1)
+                return ojsonify({"error": f"Unexpected response for events {year_int}"}), 500
+            events_list = [ev for ev in events_list if ev.get('key')]
+            ev_keys = [ev['key'] for ev in events_list]
+            settled = [_event_settled_at(ev) for ev in events_list]
+            # Fetch events concurrently; _tba_get keeps the overall request rate polite.
+            # One event failing does not sink the year: it is reported and picked up by the next /update.
+            with ThreadPoolExecutor(max_workers=TBA_MAX_WORKERS) as pool:
+                futures = [pool.submit(_fetch_event_matches, k, st) for k, st in zip(ev_keys, settled)]
+                for ev_key, future in zip(ev_keys, futures):
+                    try:
+                        matches.extend(future.result())
+                    except Exception:
+                        failed_events.append(ev_key)
     except Exception as e:
-        return jsonify({"error": f"TBA fetch failed: {e}"}), 500
-    TEAM_RATINGS.clear()
-    try:
-        matches.sort(key=lambda m: (m.get('actual_time') or m.get('time') or 0))
-    except Exception:
-        pass
-    for match in matches:
-        alliances = match.get('alliances')
-        if not alliances:
-            continue
-        red_alliance = alliances.get('red', {})
-        blue_alliance = alliances.get('blue', {})
-        teams1 = red_alliance.get('team_keys', [])
-        teams2 = blue_alliance.get('team_keys', [])
-        score1 = red_alliance.get('score')
-        score2 = blue_alliance.get('score')
-        if score1 is None or score2 is None or score1 < 0 or score2 < 0:
-            continue
-        if score1 > score2:
-            ranks = [0, 1]
-        elif score2 > score1:
-            ranks = [1, 0]
-        else:
-            ranks = [0, 0]
-        ratings1 = [get_team_rating(t) for t in teams1]
-        ratings2 = [get_team_rating(t) for t in teams2]
-        [new_ratings1, new_ratings2] = env.rate([ratings1, ratings2], ranks=ranks)
-        for t, new_r in zip(teams1, new_ratings1):
-            TEAM_RATINGS[t] = new_r
-        for t, new_r in zip(teams2, new_ratings2):
-            TEAM_RATINGS[t] = new_r
-        global LAST_EVENT_KEY, LAST_YEAR
-        LAST_EVENT_KEY = event_key if event_key else None
-        LAST_YEAR = int(year) if year else None
+        return ojsonify({"error": f"TBA fetch failed: {e}"}), 500
+    matches.sort(key=itemgetter(1))
+    with _RATINGS_WRITE_LOCK:
+        if force:
+            APPLIED_MATCH_KEYS.clear()
+        elif APPLIED_KEYS_UNKNOWN:
+            return _applied_keys_unknown_response()
+        results = []
+        new_keys = []
+        for match_key, _, teams1, score1, teams2, score2 in matches:
+            if match_key in APPLIED_MATCH_KEYS:
+                continue
+            if not (_is_valid_score(score1) and _is_valid_score(score2)):
+                continue
+            if teams1 and teams2:
+                results.append((teams1, teams2, score1, score2))
+                if match_key:
+                    new_keys.append(match_key)
+        applied_count = 0
+        ratings = RATINGS
+        # Publishing bumps the version and so drops memoized predictions; skip it when nothing changed
+        if results or force:
+            ratings = Ratings(ratings.env, ratings.version + 1) if force else ratings.draft()
+            applied_count = _rate_matches(ratings, results)
+            publish_ratings(ratings)
+            APPLIED_KEYS_UNKNOWN = False
+        APPLIED_MATCH_KEYS.update(new_keys)
+        if applied_count:
+            LAST_EVENT_KEY = event_key if event_key else None
+            LAST_YEAR = int(year) if year else None
     result: Dict[str, Any] = {"status": "rankings updated"}
     if event_key:
         result["event_key"] = event_key
     if year:
         result["year"] = year
-    result["teams_indexed"] = len(TEAM_RATINGS)
-    return jsonify(result), 200
+    result["matches_applied"] = applied_count
+    result["teams_indexed"] = len(ratings.keys)
+    if failed_events:
+        result["events_failed"] = failed_events
+    return ojsonify(result), 200
 
 @app.post("/push_results")
 def push_results():
-    """Apply additional match results (provided by client) to update ratings incrementally."""
-    data = request.get_json(force=True)
+    """
+    Apply additional match results (provided by client) to update ratings incrementally.
+    An optional "match_key" per result (TBA key) stops a later /update from applying it twice;
+    results whose match_key is not a non-empty string are skipped.
+    """
+    data = _request_json()
     if data is None:
-        return jsonify({"error": "No JSON body provided"}), 400
+        return ojsonify({"error": "No JSON body provided"}), 400
     if not isinstance(data, list):
-        return jsonify({"error": "Request body must be a JSON list of match results"}), 400
-    applied_count = 0
+        return ojsonify({"error": "Request body must be a JSON list of match results"}), 400
+    pending = []  # (match_key, teams1, teams2, score1, score2) that passed validation
     for match in data:
         teams1 = match.get("teams1")
         teams2 = match.get("teams2")
         score1 = match.get("score1")
         score2 = match.get("score2")
-        if not teams1 or not teams2 or score1 is None or score2 is None:
+        # Cheap checks first, so unplayed or malformed results never get their team lists built
+        if not teams1 or not teams2 or not (_is_valid_score(score1) and _is_valid_score(score2)):
             continue
-        if score1 > score2:
-            ranks = [0, 1]
-        elif score2 > score1:
-            ranks = [1, 0]
-        else:
-            ranks = [0, 0]
-        ratings1 = [get_team_rating(t) for t in teams1]
-        ratings2 = [get_team_rating(t) for t in teams2]
-        [new_ratings1, new_ratings2] = env.rate([ratings1, ratings2], ranks=ranks)
-        for t, new_r in zip(teams1, new_ratings1):
-            TEAM_RATINGS[t] = new_r
-        for t, new_r in zip(teams2, new_ratings2):
-            TEAM_RATINGS[t] = new_r
-        applied_count += 1
-    return jsonify({"status": "results incorporated", "applied": applied_count}), 200
+        teams1 = [str(t).strip().lower() for t in teams1]
+        teams2 = [str(t).strip().lower() for t in teams2]
+        if not all(_is_team_key(t) for t in teams1 + teams2):
+            continue
+        match_key = match.get("match_key")
+        if match_key is not None and not (isinstance(match_key, str) and match_key):
+            continue
+        pending.append((match_key, teams1, teams2, score1, score2))
+    with _RATINGS_WRITE_LOCK:
+        results = []
+        new_keys = set()  # also catches a match_key repeated within this request
+        for match_key, teams1, teams2, score1, score2 in pending:
+            if match_key in APPLIED_MATCH_KEYS or match_key in new_keys:
+                continue
+            results.append((teams1, teams2, score1, score2))
+            if match_key:
+                new_keys.add(match_key)
+        applied_count = 0
+        if results:
+            ratings = RATINGS.draft()
+            applied_count = _rate_matches(ratings, results)
+            publish_ratings(ratings)
+        APPLIED_MATCH_KEYS.update(new_keys)
+    return ojsonify({"status": "results incorporated", "applied": applied_count}), 200
 
 @app.get("/predict_team")
 def predict_team():
@@ -281,15 +933,16 @@ def predict_team():
     """
     team_key = request.args.get('team')
     if not team_key:
-        return jsonify({"error": "Missing team parameter"}), 400
+        return ojsonify({"error": "Missing team parameter"}), 400
     k = str(team_key).strip().lower()
-    if k not in TEAM_RATINGS:
-        return jsonify({"error": "Team not found"}), 404
-    rating = TEAM_RATINGS[k]
-    mu = float(rating.mu)
-    sigma = float(rating.sigma)
-    confidence_percent = round(team_confidence_from_sigma(sigma, env), 2)
-    return jsonify({
+    ratings = RATINGS
+    i = ratings.team_id.get(k)
+    if i is None:
+        return ojsonify({"error": "Team not found"}), 404
+    mu = ratings.mu[i]
+    sigma = math.sqrt(ratings.sigma2[i])
+    confidence_percent = round(team_confidence_from_sigma(sigma, ratings.env), 2)
+    return ojsonify({
         "team": k,
         "mu": mu,
         "sigma": sigma,
@@ -304,25 +957,26 @@ def predict_match():
     Request JSON: { "teams1": [...], "teams2": [...] }
     Returns win probabilities for alliance1 and alliance2.
     """
-    data = request.get_json(force=True)
+    data = _request_json()
     if data is None:
-        return jsonify({"error": "No JSON body provided"}), 400
+        return ojsonify({"error": "No JSON body provided"}), 400
     teams1 = data.get("teams1") or []
     teams2 = data.get("teams2") or []
     if not teams1 or not teams2:
-        return jsonify({"error": "teams1 and teams2 must be provided"}), 400
-    ratings1 = [get_team_rating(t) for t in teams1]
-    ratings2 = [get_team_rating(t) for t in teams2]
-    mu1 = sum(r.mu for r in ratings1)
-    mu2 = sum(r.mu for r in ratings2)
-    sigma_sq_sum = sum((r.sigma ** 2) for r in (ratings1 + ratings2))
-    N = len(ratings1) + len(ratings2)
-    delta_mu = mu1 - mu2
-    beta = env.beta
-    denom = math.sqrt(N * (beta ** 2) + sigma_sq_sum)
-    win_prob = float(env.cdf(delta_mu / denom)) if denom != 0 else 0.5
+        return ojsonify({"error": "teams1 and teams2 must be provided"}), 400
+    ratings = RATINGS
+    key = _winprob_key(ratings, teams1, teams2)
+    win_prob = _cached_winprob(key)
+    if win_prob is None:
+        if len(teams1) == 3 and len(teams2) == 3:
+            ids = [ratings.lookup(t) for t in (*teams1, *teams2)]
+            if min(ids) >= 0:
+                win_prob = float(_winprob_3v3(ratings.mu, ratings.sigma2, *ids, ratings.beta2))
+        if win_prob is None:
+            win_prob = alliance_win_probability(ratings, teams1, teams2)
+        _remember_winprob(key, win_prob)
     prediction_conf = abs(2.0 * win_prob - 1.0) * 100.0
-    return jsonify({
+    return ojsonify({
         "team1_win_prob": win_prob,
         "team2_win_prob": 1.0 - win_prob,
         "prediction_confidence_percent": round(prediction_conf, 2)
@@ -331,97 +985,107 @@ def predict_match():
 @app.route('/predict_batch', methods=['POST'])
 def predict_batch():
     """Predict win probabilities for multiple matchups in one request."""
-    data = request.get_json(force=True)
+    data = _request_json()
     if data is None:
-        return jsonify({"error": "No JSON body provided"}), 400
+        return ojsonify({"error": "No JSON body provided"}), 400
     if not isinstance(data, list):
-        return jsonify({"error": "Request body must be a JSON list"}), 400
+        return ojsonify({"error": "Request body must be a JSON list"}), 400
+    ratings = RATINGS
     results = []
+    missing = []  # (result entry, cache key) for matchups not memoized yet
     for match in data:
         teams1 = match.get("teams1") or []
         teams2 = match.get("teams2") or []
         if not teams1 or not teams2:
             results.append({"error": "teams1/teams2 missing"})
             continue
-        ratings1 = [get_team_rating(t) for t in teams1]
-        ratings2 = [get_team_rating(t) for t in teams2]
-        mu1 = sum(r.mu for r in ratings1)
-        mu2 = sum(r.mu for r in ratings2)
-        sigma_sq_sum = sum((r.sigma ** 2) for r in (ratings1 + ratings2))
-        N = len(ratings1) + len(ratings2)
-        delta_mu = mu1 - mu2
-        beta = env.beta
-        denom = math.sqrt(N * (beta ** 2) + sigma_sq_sum)
-        win_prob = float(env.cdf(delta_mu / denom)) if denom != 0 else 0.5
-        results.append({
-            "teams1": teams1,
-            "teams2": teams2,
-            "team1_win_prob": win_prob,
-            "team2_win_prob": 1.0 - win_prob
-        })
-    return jsonify(results), 200
+        entry = {"teams1": teams1, "teams2": teams2}
+        key = _winprob_key(ratings, teams1, teams2)
+        win_prob = _cached_winprob(key)
+        if win_prob is None:
+            missing.append((entry, key))
+        else:
+            entry["team1_win_prob"] = win_prob
+            entry["team2_win_prob"] = 1.0 - win_prob
+        results.append(entry)
+    if missing:
+        probs = _alliance_win_probabilities(
+            ratings, [entry["teams1"] for entry, _ in missing], [entry["teams2"] for entry, _ in missing]
+        )
+        for (entry, key), win_prob in zip(missing, probs):
+            _remember_winprob(key, win_prob)
+            entry["team1_win_prob"] = win_prob
+            entry["team2_win_prob"] = 1.0 - win_prob
+    return ojsonify(results), 200
 
 @app.post("/recalculate")
 def recalculate_values():
     """
-    Recompute derived values for all teams and re-save trueskill_data.json.
-    Optional body: {"source": "json"} to reload TEAM_RATINGS from file first.
+    Recompute derived values for all teams and queue a re-save of the ratings file (DATA_PATH).
+    Optional body: {"source": "json"} to reload ratings from file first (synchronously);
+    the re-save itself is written in the background, and a failure shows up in /health.
     """
-    body = request.get_json(silent=True) or {}
+    body = _request_json() or {}
     source = str(body.get("source", "memory")).lower()
     try:
         if source == "json":
-            payload = _load_trueskill_json(DATA_PATH)
+            payload = _load_trueskill_data(DATA_PATH)
             json_count = _count_teams_in_payload(payload)
-            loaded = _apply_json_to_memory(payload)
+            with _RATINGS_WRITE_LOCK:
+                loaded = _apply_data_to_memory(payload)
             count_for_response = json_count
         else:
-            count_for_response = len(TEAM_RATINGS)
-        saved = _save_trueskill_json(DATA_PATH)
-        saved_count = _count_teams_in_payload(saved)
-        return jsonify({
+            count_for_response = len(RATINGS.keys)
+        queued = _queue_save(DATA_PATH)
+        return ojsonify({
             "status": "recalculated",
             "source": source,
             "teams_indexed": count_for_response,
+            "save": "queued",
             "file": DATA_PATH,
-            "saved_teams_indexed": saved_count,
-            "env": saved.get("meta", {}).get("env", {}),
-            "context": saved.get("meta", {}).get("context", {})
+            "queued_teams_indexed": _count_teams_in_payload(queued),
+            "env": queued.get("meta", {}).get("env", {}),
+            "context": queued.get("meta", {}).get("context", {})
         }), 200
     except FileNotFoundError:
-        return jsonify({"error": f"No data file found at {DATA_PATH}. Run /upload_data first."}), 404
-    except json.JSONDecodeError as e:
-        return jsonify({"error": f"Corrupt JSON in {DATA_PATH}: {e}"}), 500
+        return ojsonify({"error": f"No data file found at {DATA_PATH}. Run /upload_data first."}), 404
+    except orjson.JSONDecodeError as e:
+        return ojsonify({"error": f"Corrupt JSON in {DATA_PATH}: {e}"}), 500
     except Exception as e:
-        return jsonify({"error": f"Recalculate failed: {e}"}), 500
+        return ojsonify({"error": f"Recalculate failed: {e}"}), 500
 
 @app.route('/upload_data', methods=['POST'])
 def upload_data():
-    """Persist current team data to trueskill_data.json and return a summary."""
+    """
+    Snapshot current team data and queue it to be written to the ratings file (DATA_PATH);
+    the write happens on the background save worker, so this returns before it hits disk
+    (and before it could fail: see last_save_error in /health).
+    """
     try:
-        _save_trueskill_json(DATA_PATH)
-        return jsonify({
-            "status": "saved",
+        queued = _queue_save(DATA_PATH)
+        return ojsonify({
+            "status": "queued",
             "file": DATA_PATH,
-            "teams_indexed": len(TEAM_RATINGS)
+            "teams_indexed": _count_teams_in_payload(queued)
         }), 200
     except Exception as e:
-        return jsonify({"error": f"Failed to write {DATA_PATH}: {e}"}), 500
+        return ojsonify({"error": f"Failed to snapshot ratings for {DATA_PATH}: {e}"}), 500
 
 @app.route("/load_data", methods=['POST'])
 def load_data_from_json():
     """
-    Load ratings from trueskill_data.json into memory so the API can use them for predictions.
+    Load ratings from the ratings file (.npz or legacy .json) into memory so the API can use them for predictions.
     Body (optional):
-      { "path": "custom/path/to/trueskill_data.json", "use_env_from_json": true }
+      { "path": "custom/path/to/trueskill_data.npz", "use_env_from_json": true }
     """
-    body = request.get_json(silent=True) or {}
+    body = _request_json() or {}
     path = body.get("path") or DATA_PATH
     use_env_from_json = bool(body.get("use_env_from_json", True))
     try:
-        payload = _load_trueskill_json(path)
-        loaded = _apply_json_to_memory(payload, use_env_from_json=use_env_from_json)
-        return jsonify({
+        payload = _load_trueskill_data(path)
+        with _RATINGS_WRITE_LOCK:
+            loaded = _apply_data_to_memory(payload, use_env_from_json=use_env_from_json)
+        return ojsonify({
             "status": "loaded",
             "file": path,
             "use_env_from_json": use_env_from_json,
@@ -429,25 +1093,39 @@ def load_data_from_json():
             "context": {"event_key": LAST_EVENT_KEY, "year": LAST_YEAR}
         }), 200
     except FileNotFoundError:
-        return jsonify({"error": f"No data file found at {path}. Run /upload_data first."}), 404
-    except json.JSONDecodeError as e:
-        return jsonify({"error": f"Corrupt JSON in {path}: {e}"}), 500
+        return ojsonify({"error": f"No data file found at {path}. Run /upload_data first."}), 404
+    except orjson.JSONDecodeError as e:
+        return ojsonify({"error": f"Corrupt JSON in {path}: {e}"}), 500
     except Exception as e:
-        return jsonify({"error": f"Failed to load data from {path}: {e}"}), 500
+        return ojsonify({"error": f"Failed to load data from {path}: {e}"}), 500
 
 @app.route('/leaderboard', methods=['GET'])
 def get_leaderboard():
     """
     Return a sorted list of all teams in memory with their rating information.
     Sorted by conservative rating (mu - 3*sigma) in descending order.
+    Optional ?top=K returns only the best K teams.
     """
-    if not TEAM_RATINGS:
-        return jsonify({"teams": [], "teams_indexed": 0}), 200
-    # Serialize all team ratings to dicts
-    teams_data = [_serialize_team_entry(team, rating) for team, rating in TEAM_RATINGS.items()]
-    # Sort teams by conservative_mu_3sigma (descending)
-    teams_data.sort(key=lambda entry: entry.get("conservative_mu_3sigma", 0), reverse=True)
-    return jsonify({"teams": teams_data, "teams_indexed": len(teams_data)}), 200
+    global _LEADERBOARD_CACHE
+    ratings = RATINGS
+    n = len(ratings.keys)
+    top = request.args.get("top", 0, type=int)
+    if top <= 0 or top >= n:
+        top = n  # whole table
+    version, entries, full_body = _LEADERBOARD_CACHE
+    if version != ratings.version:
+        entries, full_body = [], None
+    if len(entries) < top:
+        entries = _serialize_all_teams(ratings, by_conservative=True, top=0 if top == n else top)
+        _LEADERBOARD_CACHE = (ratings.version, entries, full_body)
+    if top < n:
+        body = orjson.dumps({"teams": entries[:top], "teams_indexed": n})
+    else:
+        if full_body is None:
+            full_body = orjson.dumps({"teams": entries, "teams_indexed": n})
+            _LEADERBOARD_CACHE = (ratings.version, entries, full_body)
+        body = full_body
+    return app.response_class(body, mimetype="application/json"), 200
 
 
 ## Run the Code! ##